@@ -1,16 +1,28 @@
 from __future__ import annotations
 
-import sys
+import argparse
+import codecs
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
-from shapely.geometry import Point
+import pyarrow as pa
+import pyogrio
+import shapely
+from pyproj import CRS, Transformer
+
+from clip_and_clean_vitosha import LAYER_CFG
 
 ENCODINGS = [None, "cp1251", "cp1250", "latin1"]  # None defaults to "utf-8"
 TARGET_CRS = "EPSG:4326"  # WGS-84 for GeoJSON
 FALLBACK_CRS = "EPSG:7801"  # BGS2005 / 3° GK zone 7
+RAW_FORMAT = "FlatGeobuf"  # binary; only the final output/ layers are GeoJSON
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DEFAULT_DL_DIR = PROJECT_ROOT / "ETL" / "downloadsRowData"
@@ -21,138 +33,270 @@ LAYER_MAP: Dict[str, str] = {
     "samostoyatelni_obekti": "units",
     "sgradi": "buildings",
 }
+_LAYER_RE = re.compile("|".join(map(re.escape, LAYER_MAP)))
+# Only the DBF fields the clean step keeps are read at all.
+KEEP_COLS: Dict[str, List[str]] = {layer: list(cfg["cols"].keys()) for layer, cfg in LAYER_CFG.items()}
+
+MOJIBAKE_CHARS = "\u00d0\u00d1\u00f0\u00f1\u017d\u017e\u0152\u0153\u00bf\u00bd\uFFFD"
+MOJIBAKE_PREFIX = 40  # only the first characters of a cell are inspected
+MOJIBAKE_THRESHOLD = 3
+REPAIR_COMBOS = [  # (encode, decode) pairs tried in order to undo a wrong decoding
+    ("cp1251", "utf-8"),
+    ("utf-8", "cp1251"),
+    ("latin1", "utf-8"),
+    ("utf-8", "latin1"),
+]
+
+_MOJIBAKE_LUT = np.zeros(0x110000, dtype=bool)
+_MOJIBAKE_LUT[[ord(c) for c in MOJIBAKE_CHARS]] = True
+
+# Built once: every KAIS shapefile is BGS2005, so the PROJ pipeline is shared by all files.
+_TARGET = CRS.from_user_input(TARGET_CRS)
+_FALLBACK = CRS.from_user_input(FALLBACK_CRS)
+_TRANSFORMER_7801_4326 = Transformer.from_crs(_FALLBACK, _TARGET, always_xy=True)
+
+gpd.options.io_engine = "pyogrio"
 
 def _find_shp_files(root: Path) -> List[Path]:
     return sorted(root.rglob("*.shp"))
 
-def _guess_bgs2005(gdf: gpd.GeoDataFrame) -> Optional[str]:
-    if gdf.empty:
+def _guess_bgs2005(geoms: gpd.GeoSeries) -> Optional[str]:
+    if geoms.empty:
         return None
-    pt: Point = gdf.geometry.iloc[0].centroid  # type: ignore[arg-type]
-    if 250_000 < pt.x < 450_000 and 4_700_000 < pt.y < 4_900_000:
+    # Median of all centroids (one GEOS batch) so a single stray feature cannot decide the guess.
+    cents = shapely.centroid(np.asarray(geoms.values))
+    x, y = np.nanmedian(shapely.get_x(cents)), np.nanmedian(shapely.get_y(cents))
+    if 250_000 < x < 450_000 and 4_700_000 < y < 4_900_000:
         return FALLBACK_CRS
     return None
 
+def _to_target_crs(geoms: gpd.GeoSeries) -> gpd.GeoSeries:
+    if not geoms.crs.equals(_FALLBACK):
+        return geoms.to_crs(_TARGET)
+    values = np.array(geoms.values, copy=True)
+    coords = shapely.get_coordinates(values)
+    x, y = _TRANSFORMER_7801_4326.transform(coords[:, 0], coords[:, 1])
+    values = shapely.set_coordinates(values, np.column_stack([x, y]))
+    return gpd.GeoSeries(values, index=geoms.index, crs=_TARGET)
+
 def _looks_mojibake(text: str) -> bool:
-    bad = set("ÐÑðñŽžŒœ¿½�")
-    return text and sum(c in bad for c in text[:40]) > 3
+    return bool(text) and sum(c in MOJIBAKE_CHARS for c in text[:MOJIBAKE_PREFIX]) > MOJIBAKE_THRESHOLD
+
+def _mojibake_mask(col: pd.Series) -> np.ndarray:
+    """Flag cells whose prefix holds more than MOJIBAKE_THRESHOLD typical mojibake characters."""
+    text = col.fillna("").astype(str).to_numpy(dtype=f"<U{MOJIBAKE_PREFIX}")
+    codepoints = text.view(np.uint32).reshape(-1, MOJIBAKE_PREFIX)
+    return _MOJIBAKE_LUT[codepoints].sum(axis=1) > MOJIBAKE_THRESHOLD
+
+def _cpg_encoding(path: Path) -> Optional[str]:
+    """Encoding declared in the shapefile's .cpg sidecar; None for UTF-8, missing or unknown."""
+    cpg = path.with_suffix(".cpg")
+    if not cpg.exists():
+        return None
+    declared = cpg.read_text(errors="ignore").strip().split()
+    if not declared:
+        return None
+    enc = declared[-1].lower()  # e.g. "UTF-8", "1251", "ANSI 1251"
+    if enc.isdigit():
+        enc = f"cp{enc}"
+    try:
+        enc = codecs.lookup(enc).name
+    except LookupError:
+        return None
+    return None if enc == "utf-8" else enc
+
+def _read_with_fallback(path: Path, columns: Optional[List[str]] = None) -> Tuple[Dict, pa.Table]:
+    # Try the .cpg declaration first; the probing loop only matters when it is missing or wrong.
+    declared = _cpg_encoding(path)
+    encodings = [declared, *(enc for enc in ENCODINGS if enc != declared)]
 
-def _read_with_fallback(path: Path) -> gpd.GeoDataFrame:
     last_err: Exception | None = None
-    for enc in ENCODINGS:
+    for enc in encodings:
         try:
-            gdf = gpd.read_file(path, encoding=enc) if enc else gpd.read_file(path)
+            meta, table = pyogrio.read_arrow(path, encoding=enc, columns=columns)
+            # Arrow reads hand over DBF bytes undecoded; invalid UTF-8 means a wrong encoding.
+            table.validate(full=True)
         except Exception as e:
             last_err = e
             continue
 
         sample = None
-        for col in gdf.select_dtypes("object"):
-            val = gdf[col].dropna().astype(str).head(1)
-            if not val.empty:
-                sample = val.iloc[0]
-                break
+        for col in table.columns:
+            if pa.types.is_string(col.type) or pa.types.is_large_string(col.type):
+                vals = col.drop_null()
+                if len(vals):
+                    sample = vals[0].as_py()
+                    break
         if sample and _looks_mojibake(sample):
             print(f"    ↳ {enc or 'utf-8'} appears corrupted, trying next")
             continue
-        print(f"    ↳ decoded with {enc or 'utf-8'}; CRS = {gdf.crs}")
+        print(f"    ↳ decoded with {enc or 'utf-8'}; CRS = {meta['crs']}")
         break
     else:
         raise last_err  # type: ignore[arg-type]
 
-    return gdf
+    return meta, table
 
 def _layer_key_from_path(path: Path) -> str:
-    for parent in path.parents:
-        for key in LAYER_MAP:
-            if key in parent.name:
-                return key
-    for key in LAYER_MAP:
-        if key in path.stem:
-            return key
+    # The innermost matching directory wins, then the file name.
+    hits = _LAYER_RE.findall(str(path.parent)) or _LAYER_RE.findall(path.stem)
+    if hits:
+        return hits[-1]
     raise ValueError(f"Unable to determine layer for {path}")
 
-def _hard_fix_cyrillic(path: Path) -> None:
-    if not path.exists():
-        return
-    gdf = gpd.read_file(path)
-    bad = set("\u00d0\u00d1\u00f0\u00f1\u017d\u017e\u0152\u0153\u00bf\u00bd\uFFFD")
-
-    def looks_bad(s: str) -> bool:
-        return s and sum(c in bad for c in s[:40]) > 3
-
-    def attempt(val: str) -> str:
-        combos = [
-            ("cp1251", "utf-8"),
-            ("utf-8", "cp1251"),
-            ("latin1", "utf-8"),
-            ("utf-8", "latin1"),
-        ]
-        for enc, dec in combos:
-            try:
-                fixed = val.encode(enc, "ignore").decode(dec, "ignore")
-                if not looks_bad(fixed):
-                    return fixed
-            except UnicodeError:
-                continue
-        return val
-
-    for col in gdf.select_dtypes(include="object"):
-        sample = str(gdf[col].iloc[0]) if not gdf[col].empty else ""
-        if looks_bad(sample):
-            gdf[col] = gdf[col].astype(str).apply(attempt)
-
-    gdf.to_file(path, driver="GeoJSON")
-    print(f"[✓] Re-encoded Cyrillic in {path.name}")
-
-def convert_and_merge(dl_dir: Path, etl_dir: Path) -> None:
-    dl_dir = dl_dir.resolve()
-    etl_dir = etl_dir.resolve()
-    geojson_dir = etl_dir / "geojson"
-    geojson_dir.mkdir(parents=True, exist_ok=True)
+def _write_layer(table: pa.Table, path: Path, driver: str) -> None:
+    pyogrio.write_arrow(
+        table, path, driver=driver, geometry_name="geometry", geometry_type="Unknown", crs=TARGET_CRS
+    )
 
-    shp_files = _find_shp_files(dl_dir)
-    if not shp_files:
-        print(f"[!] No .shp files found in {dl_dir}")
-        return
+def _write_raw(gdf: gpd.GeoDataFrame, path: Path) -> None:
+    # Keep Polygon/MultiPolygon mixes as they are instead of promoting everything to Multi.
+    # No spatial index: it would store features in Hilbert-curve order instead of source order.
+    gdf.to_file(
+        path,
+        driver=RAW_FORMAT,
+        engine="pyogrio",
+        use_arrow=True,
+        geometry_type="Unknown",
+        promote_to_multi=False,
+        SPATIAL_INDEX=False,
+    )
 
-    buckets: Dict[str, List[gpd.GeoDataFrame]] = {k: [] for k in LAYER_MAP}
+def _repair_mojibake(val: str) -> str:
+    for enc, dec in REPAIR_COMBOS:
+        try:
+            fixed = val.encode(enc, "ignore").decode(dec, "ignore")
+            if not _looks_mojibake(fixed):
+                return fixed
+        except UnicodeError:
+            continue
+    return val
 
-    for shp in shp_files:
-        rel = shp.relative_to(dl_dir)
-        print(f"[i] Reading {rel}")
-        gdf = _read_with_fallback(shp)
+def _hard_fix_cyrillic(gdf: gpd.GeoDataFrame, name: str) -> None:
+    text_cols = [
+        col
+        for col in gdf.columns
+        if col != gdf.geometry.name and (gdf[col].dtype == object or pd.api.types.is_string_dtype(gdf[col]))
+    ]
+    for col in text_cols:
+        mask = _mojibake_mask(gdf[col])
+        if mask.any():
+            # Street/quarter names repeat a lot: repair each distinct value once and map it back.
+            broken = gdf.loc[mask, col].astype(str)
+            repair = {val: _repair_mojibake(val) for val in broken.unique()}
+            gdf.loc[mask, col] = broken.map(repair)
 
-        if gdf.crs is None:
-            if (guess := _guess_bgs2005(gdf)) is None:
-                raise ValueError(f"Missing CRS for {shp}")
-            gdf.set_crs(guess, inplace=True)
-            print(f"    ↳ CRS set to {guess}")
-        if gdf.crs.to_string() != TARGET_CRS:
-            gdf = gdf.to_crs(TARGET_CRS)
-            print(f"    ↳ reprojected to {TARGET_CRS}")
+    print(f"[✓] Re-encoded Cyrillic in {name}")
 
+def _process_one(shp: Path, dl_dir: Path, geojson_dir: Optional[Path]) -> Tuple[str, pa.Table, np.ndarray]:
+    rel = shp.relative_to(dl_dir)
+    key = _layer_key_from_path(shp)
+    print(f"[i] Reading {rel}")
+    meta, table = _read_with_fallback(shp, KEEP_COLS[LAYER_MAP[key]])
+
+    # Only the geometry column goes through GeoPandas; attributes stay in Arrow.
+    geom_idx = table.schema.get_field_index(meta["geometry_name"] or "wkb_geometry")
+    geoms = gpd.GeoSeries.from_wkb(table.column(geom_idx), crs=meta["crs"])
+
+    if geoms.crs is None:
+        if (guess := _guess_bgs2005(geoms)) is None:
+            raise ValueError(f"Missing CRS for {shp}")
+        geoms = geoms.set_crs(guess)
+        print(f"    ↳ CRS set to {guess}")
+    if not geoms.crs.equals(_TARGET):
+        geoms = _to_target_crs(geoms)
+        print(f"    ↳ reprojected to {TARGET_CRS}")
+
+    # Attributes stay an Arrow table and geometries a plain array of shapely objects until the merge.
+    attrs = table.remove_column(geom_idx)
+    geom_values = np.asarray(geoms.values)
+
+    if geojson_dir is not None:
         out_individual = geojson_dir / ("_".join(rel.parts)[:-4] + ".geojson")
-        gdf.to_file(out_individual, driver="GeoJSON")
-        print(f"    ↳ saved {out_individual.relative_to(PROJECT_ROOT)}  ({len(gdf):,} features)\n")
+        wkb = pa.array(shapely.to_wkb(geom_values), type=pa.binary())
+        _write_layer(attrs.append_column("geometry", wkb), out_individual, "GeoJSON")
+        print(f"    ↳ saved {out_individual.relative_to(PROJECT_ROOT)}  ({attrs.num_rows:,} features)\n")
+    else:
+        print(f"    ↳ {attrs.num_rows:,} features\n")
+
+    return key, attrs, geom_values
+
+def build_merged(
+    dl_dir: Path, geojson_dir: Optional[Path] = None, max_workers: Optional[int] = None
+) -> Dict[str, gpd.GeoDataFrame]:
+    """Read every shapefile under *dl_dir* and return one merged layer per LAYER_MAP name, in memory."""
+    dl_dir = dl_dir.resolve()
+    shp_files = _find_shp_files(dl_dir)
+    if not shp_files:
+        print(f"[!] No .shp files found in {dl_dir}")
+        return {}
 
-        buckets[_layer_key_from_path(shp)].append(gdf)
+    buckets: Dict[str, List[Tuple[pa.Table, np.ndarray]]] = {k: [] for k in LAYER_MAP}
 
+    # Files are independent, so read + reproject them in worker processes; results come back in order.
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        for key, attrs, geoms in ex.map(_process_one, shp_files, repeat(dl_dir), repeat(geojson_dir), chunksize=1):
+            buckets[key].append((attrs, geoms))
+
+    layers: Dict[str, gpd.GeoDataFrame] = {}
     for bg_key, frames in buckets.items():
         if not frames:
             print(f"[!] Warning: no frames for {bg_key}")
             continue
-        merged = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs=TARGET_CRS)
-        out_path = etl_dir / f"{LAYER_MAP[bg_key]}_raw.geojson"
-        merged.to_file(out_path, driver="GeoJSON")
-        print(f"[✓] Layer {bg_key:<25}→ {out_path.relative_to(PROJECT_ROOT)}  ({len(merged):,} features)")
+        attrs = pa.concat_tables([a for a, _ in frames], promote_options="permissive")
+        geoms = np.concatenate([g for _, g in frames])
+        layers[LAYER_MAP[bg_key]] = gpd.GeoDataFrame(
+            attrs.to_pandas(types_mapper=pd.ArrowDtype),
+            geometry=gpd.array.from_shapely(geoms, crs=_TARGET),
+        )
+
+    if "units" in layers:
+        _hard_fix_cyrillic(layers["units"], "units")
+
+    return layers
+
+def debug_geojson_dir(etl_dir: Path, write_individual: bool) -> Optional[Path]:
+    """Return (and create) <etl_dir>/geojson/ in debug mode, else None."""
+    # Per-shapefile GeoJSON copies are a debugging aid only; ETL/geojson/ stays empty otherwise.
+    if not write_individual:
+        return None
+    geojson_dir = Path(etl_dir).resolve() / "geojson"
+    geojson_dir.mkdir(parents=True, exist_ok=True)
+    return geojson_dir
 
-    units_path = etl_dir / "units_raw.geojson"
-    _hard_fix_cyrillic(units_path)
+def convert_and_merge(
+    dl_dir: Path, etl_dir: Path, write_individual: bool = False, max_workers: Optional[int] = None
+) -> None:
+    etl_dir = etl_dir.resolve()
+    layers = build_merged(dl_dir, debug_geojson_dir(etl_dir, write_individual), max_workers)
+    if not layers:
+        return
+
+    for name, merged in layers.items():
+        out_path = etl_dir / LAYER_CFG[name]["in"]
+        _write_raw(merged, out_path)
+        print(f"[✓] Layer {name:<25}→ {out_path.relative_to(PROJECT_ROOT)}  ({len(merged):,} features)")
 
     print("\nDone — raw layers saved in", etl_dir)
 
+def add_common_args(parser: argparse.ArgumentParser) -> None:
+    """Add the dl_dir/etl_dir positionals and --debug/--workers flags shared with run_etl.py."""
+    parser.add_argument("dl_dir", nargs="?", type=Path, default=DEFAULT_DL_DIR)
+    parser.add_argument("etl_dir", nargs="?", type=Path, default=DEFAULT_ETL_DIR)
+    parser.add_argument(
+        "--debug",
+        action="store_true",
+        help="also write every source shapefile as GeoJSON under <etl_dir>/geojson/",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of processes reading shapefiles in parallel (default: CPU count)",
+    )
+
 if __name__ == "__main__":
-    dl_arg = Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DL_DIR
-    etl_arg = Path(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ETL_DIR
-    convert_and_merge(dl_arg, etl_arg)
+    parser = argparse.ArgumentParser(description="Convert KAIS shapefiles into merged raw FlatGeobuf layers.")
+    add_common_args(parser)
+    args = parser.parse_args()
+    convert_and_merge(args.dl_dir, args.etl_dir, write_individual=args.debug, max_workers=args.workers)
@@ -2,18 +2,23 @@ from __future__ import annotations
 
 import sys
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import geopandas as gpd
+import numpy as np
+import pyogrio
+import shapely
+from shapely.geometry.base import BaseGeometry
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DEFAULT_ETL_DIR = PROJECT_ROOT / "ETL"
 DEFAULT_OUT_DIR = PROJECT_ROOT / "output"
 BOUNDARY_NAME = "vitosha_boundary.geojson"
+RAW_SUFFIX = ".fgb"  # FlatGeobuf, see cadaster_to_geojson.RAW_FORMAT
 
 LAYER_CFG: Dict[str, Dict] = {
     "landparcels": {
-        "in": "landparcels_raw.geojson",
+        "in": f"landparcels_raw{RAW_SUFFIX}",
         "out": "vitosha_landparcels.geojson",
         "cols": {
             "cadnum": "cadnum",
@@ -29,7 +34,7 @@ LAYER_CFG: Dict[str, Dict] = {
         },
     },
     "units": {
-        "in": "units_raw.geojson",
+        "in": f"units_raw{RAW_SUFFIX}",
         "out": "vitosha_units.geojson",
         "cols": {
             "cadnum": "cadnum",
@@ -41,7 +46,7 @@ LAYER_CFG: Dict[str, Dict] = {
         },
     },
     "buildings": {
-        "in": "buildings_raw.geojson",
+        "in": f"buildings_raw{RAW_SUFFIX}",
         "out": "vitosha_buildings.geojson",
         "cols": {
             "cadnum": "cadnum",
@@ -54,53 +59,95 @@ LAYER_CFG: Dict[str, Dict] = {
     },
 }
 
+gpd.options.io_engine = "pyogrio"
+
 def _find_boundary(etl_dir: Path) -> Path:
     matches: List[Path] = list(etl_dir.rglob(BOUNDARY_NAME))
     if not matches:
         raise SystemExit(f"Boundary '{BOUNDARY_NAME}' not found under {etl_dir}")
     return matches[0]
 
-def _load_boundary(etl_dir: Path) -> gpd.GeoDataFrame:
+def _load_boundary(etl_dir: Path) -> Tuple[gpd.GeoDataFrame, BaseGeometry]:
     bnd_path = _find_boundary(etl_dir)
     print(f"[i] Boundary found: {bnd_path.relative_to(etl_dir)}")
-    return gpd.read_file(bnd_path).to_crs("EPSG:4326")
-
-def _clip_clean_save(layer_key: str, cfg: Dict, boundary: gpd.GeoDataFrame, etl_dir: Path, out_dir: Path) -> None:
-    raw_path = etl_dir / cfg["in"]
-    if not raw_path.exists():
-        hits = list(etl_dir.rglob(cfg["in"]))
-        if hits:
-            raw_path = hits[0]
-        else:
-            raise SystemExit(f"Missing raw layer '{cfg['in']}' under {etl_dir}")
-
-    gdf = gpd.read_file(raw_path)
+    boundary = gpd.read_file(bnd_path, engine="pyogrio", use_arrow=True).to_crs("EPSG:4326")
+    # Dissolve and prepare once; every layer's intersects/contains queries reuse the GEOS index.
+    poly = boundary.union_all()
+    shapely.prepare(poly)
+    return boundary, poly
+
+def _clip_clean(
+    layer_key: str, cfg: Dict, gdf: gpd.GeoDataFrame, boundary: gpd.GeoDataFrame, poly: BaseGeometry
+) -> gpd.GeoDataFrame:
     if gdf.crs != boundary.crs:
         gdf = gdf.to_crs(boundary.crs)
 
-    clipped = gpd.clip(gdf, boundary)
-
     cols_map = cfg["cols"]
-    missing = set(cols_map.keys()) - set(clipped.columns)
+    missing = set(cols_map.keys()) - set(gdf.columns)
     if missing:
         raise ValueError(f"{layer_key}: columns missing in source: {missing}")
 
-    cleaned = clipped[list(cols_map.keys()) + ["geometry"]].rename(columns=cols_map)
+    # Features fully inside the boundary are kept as-is; only those crossing it are cut.
+    hits = np.sort(gdf.sindex.query(poly, predicate="intersects"))
+    crossing = ~np.isin(hits, gdf.sindex.query(poly, predicate="contains"))
+
+    # One row take in source order over the kept columns; cut geometries are patched in place.
+    clipped = gdf[list(cols_map.keys()) + ["geometry"]].iloc[hits]
+    geoms = clipped.geometry.values.copy()
+    geoms[crossing] = geoms[crossing].intersection(poly)
+    clipped = clipped.set_geometry(geoms)[~geoms.is_empty]
+
+    return clipped.rename(columns=cols_map)
 
+def _save(layer_key: str, cfg: Dict, cleaned: gpd.GeoDataFrame, out_dir: Path) -> None:
     out_dir.mkdir(parents=True, exist_ok=True)
     out_path = out_dir / cfg["out"]
-    cleaned.to_file(out_path, driver="GeoJSON")
+    cleaned.to_file(out_path, driver="GeoJSON", engine="pyogrio", use_arrow=True)
     print(f"[✓] {layer_key:<12} → {out_path.relative_to(PROJECT_ROOT)}  ({len(cleaned):,} features)")
 
-def main(etl_dir: Path = DEFAULT_ETL_DIR, out_dir: Path = DEFAULT_OUT_DIR) -> None:
+def _clip_clean_save(
+    layer_key: str, cfg: Dict, boundary: gpd.GeoDataFrame, poly: BaseGeometry, etl_dir: Path, out_dir: Path
+) -> None:
+    raw_path = etl_dir / cfg["in"]
+    if not raw_path.exists():
+        hits = list(etl_dir.rglob(cfg["in"]))
+        if hits:
+            raw_path = hits[0]
+        else:
+            raise SystemExit(f"Missing raw layer '{cfg['in']}' under {etl_dir}")
+
+    # Let GDAL drop features outside the boundary while reading; the mask must be in the source CRS.
+    src_crs = pyogrio.read_info(raw_path)["crs"]
+    mask = boundary.to_crs(src_crs).union_all() if src_crs and boundary.crs != src_crs else poly
+    gdf = gpd.read_file(raw_path, engine="pyogrio", use_arrow=True, mask=mask)
+
+    _save(layer_key, cfg, _clip_clean(layer_key, cfg, gdf, boundary, poly), out_dir)
+
+def clean_all(
+    merged: Dict[str, gpd.GeoDataFrame], boundary: gpd.GeoDataFrame, poly: BaseGeometry, out_dir: Path
+) -> None:
+    for key, cfg in LAYER_CFG.items():
+        if key not in merged:
+            raise SystemExit(f"Missing merged layer '{key}'")
+        _save(key, cfg, _clip_clean(key, cfg, merged[key], boundary, poly), out_dir)
+
+def main(
+    etl_dir: Path = DEFAULT_ETL_DIR,
+    out_dir: Path = DEFAULT_OUT_DIR,
+    merged: Optional[Dict[str, gpd.GeoDataFrame]] = None,
+) -> None:
     etl_dir = Path(etl_dir).resolve()
     out_dir = Path(out_dir).resolve()
 
-    boundary = _load_boundary(etl_dir)
+    boundary, poly = _load_boundary(etl_dir)
     print(f"[i] Boundary loaded; CRS = {boundary.crs}")
 
-    for key, cfg in LAYER_CFG.items():
-        _clip_clean_save(key, cfg, boundary, etl_dir, out_dir)
+    # Layers handed over in memory (see run_etl.py) skip the raw FlatGeobuf round-trip.
+    if merged is not None:
+        clean_all(merged, boundary, poly, out_dir)
+    else:
+        for key, cfg in LAYER_CFG.items():
+            _clip_clean_save(key, cfg, boundary, poly, etl_dir, out_dir)
 
     print("\nDone — cleaned layers saved in", out_dir)
 
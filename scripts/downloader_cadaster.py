@@ -2,9 +2,14 @@ import os
 import requests
 import zipfile
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+CHUNK_SIZE = 1 << 20  # 1 MiB buffers for both the download and the unzip
+
 class CadastralDownloader:
+    MAX_WORKERS = 4
+
     DISTRICT_BG = {
         'lozenets': 'Лозенец',
         'studentski': 'Студентски',
@@ -23,6 +28,7 @@ class CadastralDownloader:
 
         self.base_dir = Path(__file__).resolve().parent
         self.downloads_base = self.base_dir / 'downloadsRowData'
+        self.session = requests.Session()
 
     def download_data(self, url: str, filename: str):
         if not filename.endswith('.zip'):
@@ -32,11 +38,13 @@ class CadastralDownloader:
         subfolder_path.mkdir(parents=True, exist_ok=True)
 
         zip_path = subfolder_path / filename
-        r = requests.get(url)
-        if r.status_code != 200:
-            print(f'[✘] Fail to download ({r.status_code})')
-            return
-        zip_path.write_bytes(r.content)
+        with self.session.get(url, stream=True, timeout=60) as r:
+            if r.status_code != 200:
+                print(f'[✘] Fail to download ({r.status_code})')
+                return
+            r.raw.decode_content = True
+            with open(zip_path, 'wb') as f:
+                shutil.copyfileobj(r.raw, f, length=CHUNK_SIZE)
         print(f'[✔] Downloaded: {zip_path}')
 
         extract_path = subfolder_path / filename.replace('.zip', '')
@@ -61,7 +69,7 @@ class CadastralDownloader:
                 dest = extract_path / relative
                 dest.parent.mkdir(parents=True, exist_ok=True)
                 with zf.open(member) as src, open(dest, 'wb') as dst:
-                    shutil.copyfileobj(src, dst)
+                    shutil.copyfileobj(src, dst, length=CHUNK_SIZE)
         print(f'[✔] Unzipped (flattened) in: {extract_path}')
 
         zip_path.unlink()
@@ -78,11 +86,13 @@ class CadastralDownloader:
             "sgradi": "сгради.zip",
             "samostoyatelni_obekti": "самостоятелни обекти.zip",
         }
-        for key, zipped_file in data_types.items():
-            url = base_url + prefix + zipped_file
-            filename = f"{self.district_slug}_{key}"
-            self.download_data(url, filename)
+        tasks = [
+            (base_url + prefix + zipped_file, f"{self.district_slug}_{key}")
+            for key, zipped_file in data_types.items()
+        ]
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as ex:
+            list(ex.map(lambda task: self.download_data(*task), tasks))
 
 if __name__ == "__main__":
-    CadastralDownloader("lozenets").collect_all()
-    CadastralDownloader("studentski").collect_all()
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        list(ex.map(lambda slug: CadastralDownloader(slug).collect_all(), ["lozenets", "studentski"]))
@@ -1,6 +1,9 @@
 import geopandas as gpd
 import folium
-from shapely.geometry import box
+from folium.plugins import HeatMap
+import math
+import numpy as np
+import shapely
 from pathlib import Path
 
 BASE = Path(__file__).resolve().parent.parent / "output"
@@ -10,15 +13,23 @@ MUNICIPAL_FP = BASE / "municipal_land_parking.geojson"
 OUTPUT_HTML = BASE / "vitosha_parking_heatmap.html"
 
 BUFFER_RADIUS = 50
+BUFFER_QUAD_SEGS = 4
 GRID_CELLS = 800
+ZOOM_START = 15
+
+gpd.options.io_engine = "pyogrio"
+
+if int(shapely.__version__.split(".")[0]) < 2:
+    raise SystemExit(f"Shapely >= 2.0 is required, found {shapely.__version__}")
 
 print("[i] Loading input GeoJSON files…")
-buildings = gpd.read_file(PARKING_NUM_FP).to_crs(epsg=3857)
-cars = gpd.read_file(PARKED_CARS_FP).to_crs(epsg=3857)
-municipal = gpd.read_file(MUNICIPAL_FP).to_crs(epsg=3857)
+buildings = gpd.read_file(PARKING_NUM_FP, engine="pyogrio", use_arrow=True).to_crs(epsg=3857)
+cars = gpd.read_file(PARKED_CARS_FP, engine="pyogrio", use_arrow=True).to_crs(epsg=3857)
+municipal = gpd.read_file(MUNICIPAL_FP, engine="pyogrio", use_arrow=True).to_crs(epsg=3857)
 
-buildings["buffer_geom"] = buildings.geometry.buffer(BUFFER_RADIUS)
-buildings["cars_in_buffer"] = buildings["buffer_geom"].apply(lambda buf: cars.within(buf).sum())
+buffers = buildings.geometry.buffer(BUFFER_RADIUS, quad_segs=BUFFER_QUAD_SEGS)
+buffer_idx, _ = cars.sindex.query(buffers.values, predicate="contains")
+buildings["cars_in_buffer"] = np.bincount(buffer_idx, minlength=len(buffers))
 buildings["total_supply"] = buildings["num_garages"] + buildings["cars_in_buffer"]
 buildings["parking_deficit"] = (buildings["sum_needed_place"] - buildings["total_supply"]).clip(lower=0)
 
@@ -30,86 +41,88 @@ height = maxy - miny
 cell_area = (width * height) / GRID_CELLS
 cell_size = (cell_area)**0.5
 cols = int(width // cell_size)
-rows = int(GRID_CELLS // cols) + 1
+rows = math.ceil(height / cell_size)
 
-grid_cells = [
-    box(minx + i * cell_size, miny + j * cell_size,
-        minx + (i + 1) * cell_size, miny + (j + 1) * cell_size)
-    for i in range(cols) for j in range(rows)
-]
+ix, jy = np.meshgrid(np.arange(cols), np.arange(rows), indexing="ij")
+grid_cells = shapely.box(
+    (minx + ix * cell_size).ravel(), (miny + jy * cell_size).ravel(),
+    (minx + (ix + 1) * cell_size).ravel(), (miny + (jy + 1) * cell_size).ravel(),
+)
 
 grid = gpd.GeoDataFrame(geometry=grid_cells, crs=buildings.crs)
 
-joined = gpd.sjoin(buildings.set_geometry("geometry"), grid, how="inner", predicate="intersects")
-cell_deficit = joined.groupby("index_right")["parking_deficit"].sum().reset_index()
-
-grid["parking_deficit"] = 0
-grid.loc[cell_deficit["index_right"], "parking_deficit"] = cell_deficit["parking_deficit"].values
+# The tree goes on the grid, the smaller layer; buildings are the bulk query.
+building_idx, cell_idx = grid.sindex.query(buildings.geometry.values, predicate="intersects")
+deficits = buildings["parking_deficit"].to_numpy()
+cell_deficit = np.zeros(len(grid), dtype=deficits.dtype)
+np.add.at(cell_deficit, cell_idx, deficits[building_idx])
+grid["parking_deficit"] = cell_deficit
 
 print("[i] Generating heatmap…")
-center_geom = buildings.to_crs(epsg=4326).geometry.unary_union.centroid
-map_center = [center_geom.y, center_geom.x]
-m = folium.Map(location=map_center, zoom_start=15, tiles="cartodbpositron")
-
-def color_scale(val, vmin, vmax):
-    adjusted_max = max(vmax, 100)
-    ratio = min(max(val / adjusted_max, 0), 1)
-    r = 255
-    g = int(255 * (1 - ratio))
-    return f"#{r:02x}{g:02x}00"
-
-vmin, vmax = grid["parking_deficit"].min(), grid["parking_deficit"].max()
-
-for _, row in grid.to_crs(epsg=4326).iterrows():
-    if row["parking_deficit"] > 0:
-        folium.GeoJson(
-            row.geometry,
-            style_function=lambda x, val=row["parking_deficit"]: {
-                "fillColor": color_scale(val, vmin, vmax),
-                "color": "black",
-                "weight": 0.2,
-                "fillOpacity": 0.5,
-            },
-            tooltip=f"Deficit: {row['parking_deficit']}"
-        ).add_to(m)
-
-for _, row in municipal.to_crs(epsg=4326).iterrows():
-    tooltip_text = (
-        f"Municipal Property\n"
-        f"1 floor: {row.get('1_flor_parking_places', 'n/a')}\n"
-        f"2 floors: {row.get('2_flor_parking_places', 'n/a')}\n"
-        f"3 floors: {row.get('3_flor_parking_places', 'n/a')}\n"
-        f"4 floors: {row.get('4_flor_parking_places', 'n/a')}"
-    )
-    folium.GeoJson(
-        row.geometry,
-        style_function=lambda x: {
-            "fillColor": "green",
-            "color": "black",
-            "weight": 0.5,
-            "fillOpacity": 0.6,
-        },
-        tooltip=tooltip_text
-    ).add_to(m)
-
-for _, row in buildings.to_crs(epsg=4326).iterrows():
-    tooltip_text = (
-        f"Building\n"
-        f"Type: {row.get('functype', 'n/a')}\n"
-        f"Available (garage + street): {row['total_supply']}\n"
-        f"Needed: {row['sum_needed_place']}\n"
-        f"Deficit: {row['parking_deficit']}"
-    )
-    folium.GeoJson(
-        row.geometry,
-        style_function=lambda x: {
-            "fillColor": "blue",
-            "color": "black",
-            "weight": 0.3,
-            "fillOpacity": 0.5,
-        },
-        tooltip=tooltip_text
-    ).add_to(m)
+buildings_4326 = buildings[["geometry"]].to_crs(epsg=4326)
+municipal_4326 = municipal[["geometry"]].to_crs(epsg=4326)
+
+minx, miny, maxx, maxy = buildings_4326.total_bounds
+map_center = [(miny + maxy) / 2, (minx + maxx) / 2]
+m = folium.Map(location=map_center, zoom_start=ZOOM_START, tiles="cartodbpositron")
+
+def text_column(gdf, col):
+    if col not in gdf.columns:
+        return "n/a"
+    return gdf[col].astype(str)
+
+vmax = grid["parking_deficit"].max()
+
+deficit_cells = grid[grid["parking_deficit"] > 0]
+# Same clamp as the old fill scale: full red only from a deficit of max(vmax, 100).
+weights = np.clip(deficit_cells["parking_deficit"].to_numpy() / max(vmax, 100), 0, 1)
+cell_centers = shapely.get_coordinates(deficit_cells.geometry.centroid.to_crs(epsg=4326))
+# Web Mercator metres per pixel at the initial zoom, so one blob spans about one cell
+cell_size_px = cell_size / (156543.03392 / 2 ** ZOOM_START)
+
+HeatMap(
+    np.column_stack([cell_centers[:, 1], cell_centers[:, 0], weights]),
+    radius=cell_size_px,
+    gradient={0.0: "#ffff00", 1.0: "#ff0000"},
+).add_to(m)
+
+municipal_4326["tooltip"] = (
+    "Municipal Property\n"
+    + "1 floor: " + text_column(municipal, "1_flor_parking_places") + "\n"
+    + "2 floors: " + text_column(municipal, "2_flor_parking_places") + "\n"
+    + "3 floors: " + text_column(municipal, "3_flor_parking_places") + "\n"
+    + "4 floors: " + text_column(municipal, "4_flor_parking_places")
+)
+
+folium.GeoJson(
+    municipal_4326,
+    style_function=lambda x: {
+        "fillColor": "green",
+        "color": "black",
+        "weight": 0.5,
+        "fillOpacity": 0.6,
+    },
+    tooltip=folium.GeoJsonTooltip(fields=["tooltip"], labels=False)
+).add_to(m)
+
+buildings_4326["tooltip"] = (
+    "Building\n"
+    + "Type: " + text_column(buildings, "functype") + "\n"
+    + "Available (garage + street): " + buildings["total_supply"].astype(str) + "\n"
+    + "Needed: " + buildings["sum_needed_place"].astype(str) + "\n"
+    + "Deficit: " + buildings["parking_deficit"].astype(str)
+)
+
+folium.GeoJson(
+    buildings_4326,
+    style_function=lambda x: {
+        "fillColor": "blue",
+        "color": "black",
+        "weight": 0.3,
+        "fillOpacity": 0.5,
+    },
+    tooltip=folium.GeoJsonTooltip(fields=["tooltip"], labels=False)
+).add_to(m)
 
 m.save(str(OUTPUT_HTML))
 print(f"[✓] Map saved to: {OUTPUT_HTML}")
@@ -0,0 +1,36 @@
+"""
+Run the cadaster ETL in one process: shapefiles → merged layers → Vitosha clip.
+
+The merged layers are handed from cadaster_to_geojson to clip_and_clean_vitosha
+in memory, so the intermediate ETL/*_raw.fgb files are neither written nor read.
+
+Usage:
+    python run_etl.py [dl_dir] [etl_dir] [out_dir] [--debug] [--workers N]
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+import clip_and_clean_vitosha
+from cadaster_to_geojson import DEFAULT_DL_DIR, DEFAULT_ETL_DIR, add_common_args, build_merged, debug_geojson_dir
+
+def main(
+    dl_dir: Path = DEFAULT_DL_DIR,
+    etl_dir: Path = DEFAULT_ETL_DIR,
+    out_dir: Path = clip_and_clean_vitosha.DEFAULT_OUT_DIR,
+    write_individual: bool = False,
+    max_workers: int | None = None,
+) -> None:
+    merged = build_merged(Path(dl_dir), debug_geojson_dir(etl_dir, write_individual), max_workers)
+    if not merged:
+        return
+    clip_and_clean_vitosha.main(etl_dir, out_dir, merged=merged)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the cleaned Vitosha layers straight from KAIS shapefiles.")
+    add_common_args(parser)
+    parser.add_argument("out_dir", nargs="?", type=Path, default=clip_and_clean_vitosha.DEFAULT_OUT_DIR)
+    args = parser.parse_args()
+    main(args.dl_dir, args.etl_dir, args.out_dir, write_individual=args.debug, max_workers=args.workers)
@@ -31,41 +31,39 @@ from pathlib import Path
 from typing import Tuple
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 
-def base_cadnum(cadnum: str) -> str:
-    """Extract first three segments of a cadastral number."""
-    if not cadnum or not isinstance(cadnum, str):
-        return ""
-    return ".".join(cadnum.split(".")[:3])
+gpd.options.io_engine = "pyogrio"
 
-def needed_places(area: float | int | None) -> int:
-    """Determine required parking: 1 if <90 m², else 2."""
-    try:
-        return 1 if float(area) < 90.0 else 2
-    except (TypeError, ValueError):
-        return 1
+def base_cadnums(cadnums: pd.Series) -> pd.Series:
+    """Extract first three segments of each cadastral number ("" if missing)."""
+    return cadnums.str.split(".", n=3).str[:3].str.join(".").fillna("")
+
+def needed_places_array(areas: pd.Series) -> np.ndarray:
+    """Determine required parking per unit: 1 if <90 m² or unknown, else 2."""
+    area = pd.to_numeric(areas, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    return np.where(area >= 90.0, 2, 1)
 
 def compute_parcel_stats(units: gpd.GeoDataFrame) -> pd.DataFrame:
     """Compute parking statistics per cadastral parcel."""
     units = units.copy()
-    units["parcel_id"] = units["cadnum"].apply(base_cadnum)
-
-    is_apartment = units["apptype"].str.contains("Жилище", na=False, case=False)
-    is_garage = units["apptype"].str.contains("Гараж", na=False, case=False)
-
-    apartments = units[is_apartment]
-    garages = units[is_garage]
+    units["parcel_id"] = base_cadnums(units["cadnum"])
 
-    apartment_counts = apartments.groupby("parcel_id").size().rename("num_apartments")
-    garage_counts = garages.groupby("parcel_id").size().rename("num_garages")
+    # Match on the few distinct unit types, then broadcast through the codes.
+    apptype = units["apptype"].astype("category").cat
+    codes = apptype.codes.to_numpy()
+    is_apartment = np.isin(codes, np.flatnonzero(apptype.categories.str.contains("Жилище", case=False)))
+    is_garage = np.isin(codes, np.flatnonzero(apptype.categories.str.contains("Гараж", case=False)))
 
-    apartments["req"] = apartments["area"].apply(needed_places)
-    demand = apartments.groupby("parcel_id")["req"].sum().rename("sum_needed_place")
+    units["num_apartments"] = is_apartment.astype(np.int32)
+    units["num_garages"] = is_garage.astype(np.int32)
+    units["sum_needed_place"] = np.where(is_apartment, needed_places_array(units["area"]), 0).astype(np.int32)
 
     stats = (
-        pd.concat([apartment_counts, garage_counts, demand], axis=1)
-        .fillna(0)
+        units.loc[is_apartment | is_garage]
+        .groupby("parcel_id", sort=False)[["num_apartments", "num_garages", "sum_needed_place"]]
+        .sum()
         .astype(int)
         .reset_index()
         .rename(columns={"parcel_id": "cadnum"})
@@ -84,30 +82,21 @@ def main(
     output_fp = Path(output_fp)
 
     print("[i] Loading input data…")
-    buildings = gpd.read_file(buildings_fp)
-    units = gpd.read_file(units_fp)
+    buildings = gpd.read_file(buildings_fp, engine="pyogrio", use_arrow=True)
+    units = gpd.read_file(units_fp, engine="pyogrio", use_arrow=True)
 
     print("[i] Calculating parcel statistics…")
     parcel_stats = compute_parcel_stats(units)
 
-    buildings = buildings.copy()
-    buildings["parcel_id"] = buildings["cadnum"].apply(base_cadnum)
+    parcel_ids = base_cadnums(buildings["cadnum"])
+    parcel_stats = parcel_stats.set_index("cadnum")
 
     print("[i] Merging statistics with buildings layer…")
-    enriched = buildings.merge(
-        parcel_stats.rename(columns={"cadnum": "parcel_id"}),
-        on="parcel_id",
-        how="left",
-    )
-
-    for col in ["num_apartments", "num_garages", "sum_parking_place", "sum_needed_place"]:
-        if col in enriched.columns:
-            enriched[col] = enriched[col].fillna(0).astype(int)
-
-    enriched.drop(columns=["parcel_id"], inplace=True)
+    for col in ["num_apartments", "num_garages", "sum_needed_place", "sum_parking_place"]:
+        buildings[col] = parcel_ids.map(parcel_stats[col]).fillna(0).astype(np.int32)
 
-    print(f"[✓] Writing output with {len(enriched):,} features → {output_fp}")
-    enriched.to_file(output_fp, driver="GeoJSON")
+    print(f"[✓] Writing output with {len(buildings):,} features → {output_fp}")
+    buildings.to_file(output_fp, driver="GeoJSON", engine="pyogrio", use_arrow=True)
     print("[✔] Done.")
 
 if __name__ == "__main__":